@@ -7,14 +7,12 @@
 """
 import os
 import copy
-from tqdm import tqdm
 import logging
 import requests
 from typing import List, Any, Set
 import shutil
-from tqdm import tqdm
 from time import sleep
-from sqlalchemy import func, and_, or_
+from sqlalchemy import func, and_, or_, select
 from src.database.basic_sqlalchemy_interface import BasicSQLAlchemyInterface, FilterMask
 from src.database.data_model import populate_data_infrastructure, get_default_entries
 from src.model.civitai_api_wrapper import CivitaiAPIWrapper
@@ -32,9 +30,10 @@ def fetch_model_entries_by_type(database: BasicSQLAlchemyInterface, model_type:
     :param model_type: Target model type.
     :return: Model entries.
     """
+    model = database.model["model"]
     with database.session_factory() as session:
-        result = session.query(database.model["model"]).filter(func.json_extract(database.model["model"].data, "$.type") == model_type).all()
-    return [obj.data for obj in result]
+        return list(session.execute(select(model.data).where(
+            model.model_type == model_type).execution_options(yield_per=1000)).scalars())
 
 
 def fetch_all_model_types(database: BasicSQLAlchemyInterface) -> Set:
@@ -43,13 +42,9 @@ def fetch_all_model_types(database: BasicSQLAlchemyInterface) -> Set:
     :param database: Database.
     :return: Set of model types.
     """
-    available_types = set()
+    model = database.model["model"]
     with database.session_factory() as session:
-        progress_bar = tqdm(desc="Iterating over model entries...", unit="models", total=database.get_object_count_by_type("model"), leave=False)
-        for obj in session.query(database.model["model"]).yield_per(100):
-            available_types.add(obj.data["type"])
-            progress_bar.update()
-    return available_types
+        return set(session.execute(select(func.distinct(model.model_type))).scalars())
 
 
 def count_model_versions(database: BasicSQLAlchemyInterface, model_type: str | None = None) -> int:
@@ -60,13 +55,12 @@ def count_model_versions(database: BasicSQLAlchemyInterface, model_type: str | N
         Defaults to None in which case all model versions are counted.
     :return: Model version count.
     """
-    counter = 0
+    model = database.model["model"]
     with database.session_factory() as session:
-        progress_bar = tqdm(desc=f"Iterating over model entries {' searching for ' + model_type + 's' if model_type else ''}...", unit="models", total=database.get_object_count_by_type("model"), leave=False)
-        for obj in session.query(database.model["model"]).filter((model_type is None) or (func.json_extract(database.model["model"].data, "$.type") == model_type)).yield_per(100):
-            counter+=len(obj.data["modelVersions"])
-            progress_bar.update()
-    return counter
+        query = session.query(func.coalesce(func.sum(model.version_count), 0))
+        if model_type is not None:
+            query = query.filter(model.model_type == model_type)
+        return int(query.scalar())
 
 
 if __name__ == "__main__":
@@ -5,8 +5,10 @@
 *            (c) 2025 Alexander Hering             *
 ****************************************************
 """
+import sys
 import requests
-import json
+import orjson
+from operator import itemgetter
 from src.utility import json_utility
 
 # API Documentation: https://developer.civitai.com/docs/api/public-rest
@@ -24,16 +26,19 @@ models_params = "?sort=Newest&limit=5&nsfw=true"
 
 # Fetch model metadata and save it to file
 resp = requests.get(models_base_url + models_params, headers=headers)
-data = json.loads(resp.content)
+data = orjson.loads(resp.content)
 json_utility.save(data=data, path="response.json")
 
 # Response data always contains "items" with the list of requested entries, and "metadata"
 # The response "metadata" contains a cursor and the next page under "nextPage"
 # Requesting the next page as seen above will yield the next 5 model entries under the given parameter conditions
+# The output is collected and written at once
+get_model_version_fields = itemgetter("id", "name", "baseModel", "downloadUrl")
+lines = []
 for model_entry in data["items"]:
-    print(f"Model {model_entry['id']}: '{model_entry['name']}'")
-    for model_version_entry in model_entry["modelVersions"]:
-        print(f"\tModelversion {model_version_entry['id']}: '{model_version_entry['name']}' ({model_version_entry['baseModel']}) - Download: '{model_version_entry['downloadUrl']}?token={api_key}'")
-    print("")
-
-print(f"Next API page to fetch: {data['metadata']['nextPage']}")
+    lines.append(f"Model {model_entry['id']}: '{model_entry['name']}'")
+    lines.extend(f"\tModelversion {version_id}: '{name}' ({base_model}) - Download: '{download_url}?token={api_key}'" 
+                 for version_id, name, base_model, download_url in map(get_model_version_fields, model_entry["modelVersions"]))
+    lines.append("")
+lines.append(f"Next API page to fetch: {data['metadata']['nextPage']}")
+sys.stdout.write("\n".join(lines) + "\n")
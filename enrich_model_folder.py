@@ -6,15 +6,38 @@
 ****************************************************
 """
 import os
-from typing import Any, Optional, Tuple
-from src.utility import json_utility, hashing_utility, image_utility, internet_utility
+import re
+from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from typing import Any, Optional, Tuple, Callable, Dict, List
+from sqlalchemy import select
+from src.utility import json_utility, hashing_utility, image_utility, internet_utility, file_system_utility
 from src.model.civitai_api_wrapper import CivitaiAPIWrapper
-from src.configuration.config import LOGGER, API_KEY, RAW_RESPONSE_FOLDER, DATA_FOLDER
+from src.database.basic_sqlalchemy_interface import BasicSQLAlchemyInterface
+from src.database.data_model import populate_data_infrastructure, get_default_entries, get_model_columns
+from src.database.hash_index import HashIndex
+from src.configuration.config import LOGGER, API_KEY, RAW_RESPONSE_FOLDER, DATABASE_FOLDER, DATA_FOLDER, ensure_folders
 
 
-MODEL_EXTENSIONS = [".safetensors", ".ckpt", ".pt", ".zip", ".pth"]
+MODEL_EXTENSIONS = frozenset([".safetensors", ".ckpt", ".pt", ".zip", ".pth"])
 IMG_WIDTHS = [1080, 720, 576, 480]
-IMG_EXTS = [".jpeg", ".jpg", ".png"]
+IMG_EXTS = frozenset([".jpeg", ".jpg", ".png"])
+IMG_WIDTH_PATTERN = re.compile(r"/width=[^/]*")
+
+
+def make_image_url_formatter(image_data: dict) -> Callable[[int | None], str]:
+    """
+    Creates a formatter for civitai image URLs with varying widths.
+    The URL is split around its width segment once, so that formatting only fills in the width.
+    :param image_data: Image data.
+    :return: Formatter, taking a forced width or None for the original width and returning the fixed image URL.
+    """
+    url = image_data["url"]
+    match = IMG_WIDTH_PATTERN.search(url)
+    if match is None:
+        return lambda width: url
+    prefix, suffix = url[:match.start()], url[match.end():]
+    return lambda width: f"{prefix}/width={image_data['width'] if width is None else width}{suffix}"
 
 
 def fix_image_url(image_data: dict, width: int = None) -> str:
@@ -24,11 +47,57 @@ def fix_image_url(image_data: dict, width: int = None) -> str:
     :param width: Forced width to use.
     :return: Fixed image URL.
     """
-    img_url_parts = image_data["url"].split("/")
-    for index, part in enumerate(img_url_parts):
-        if part.startswith("width="):
-            img_url_parts[index] = f"width={image_data['width'] if width is None else width}"
-    return "/".join(img_url_parts)
+    return make_image_url_formatter(image_data)(width)
+
+
+def get_hash_for_model_file(model_file_path: str, save_hash: bool = True) -> str:
+    """
+    Retrieves the SHA256 hash for model file, preferring an existing hash file.
+    :param model_file_path: Path of the model file.
+    :param save_hash: Flag for declaring whether to save hash.
+        Defaults to true.
+    :return: Hash.
+    """
+    model_hash_path = f"{os.path.splitext(model_file_path)[0]}.hash"
+    if not os.path.exists(model_hash_path):
+        hash = hashing_utility.hash_with_sha256(model_file_path)
+        if save_hash:
+            with open(model_hash_path, "w") as hash_file:
+                hash_file.write(hash)
+    else:
+        with open(model_hash_path, "r") as hash_file:
+            hash = hash_file.read()
+    return hash
+
+
+def load_metadata_from_database(database: BasicSQLAlchemyInterface, object_type: str, urls: List[str]) -> Dict[str, dict]:
+    """
+    Loads fully scraped metadata from database.
+    :param database: Database.
+    :param object_type: Object type out of ["model", "modelversion"].
+    :param urls: API URLs of the metadata entries.
+    :return: Dictionary, mapping URLs to metadata.
+    """
+    model = database.model[object_type]
+    with database.session_factory() as session:
+        return {url: data for url, data in session.execute(select(model.url, model.data).where(
+            model.url.in_(urls), model.state == "full"))}
+
+
+def save_metadata_to_database(database: BasicSQLAlchemyInterface, object_type: str, entries: Dict[str, dict]) -> None:
+    """
+    Saves metadata to database in a single transaction.
+    :param database: Database.
+    :param object_type: Object type out of ["model", "modelversion"].
+    :param entries: Dictionary, mapping API URLs to metadata.
+    """
+    if not entries:
+        return
+    database.bulk_upsert(object_type, [{"url": url, 
+                                        "source": "civitai.com", 
+                                        "data": entry, 
+                                        **(get_model_columns(entry) if object_type == "model" else {}), 
+                                        "state": "full"} for url, entry in entries.items()])
 
 
 def download_data_for_model_file(wrapper: CivitaiAPIWrapper,
@@ -36,7 +105,10 @@ def download_data_for_model_file(wrapper: CivitaiAPIWrapper,
                                  skip_filename_check: bool = True,
                                  save_model_metadata: bool = True,
                                  save_hash: bool = True,
-                                 save_cover_image: bool = True) -> Tuple[Optional[str], Optional[dict], Optional[dict], Optional[str]]:
+                                 save_cover_image: bool = True,
+                                 model_hash: str | None = None,
+                                 model_version_metadata: dict | None = None,
+                                 database: BasicSQLAlchemyInterface | None = None) -> Tuple[Optional[str], Optional[dict], Optional[dict], Optional[str]]:
     """
     Downloads additional data for model file.
     :param wrapper: API wrapper.
@@ -49,6 +121,13 @@ def download_data_for_model_file(wrapper: CivitaiAPIWrapper,
         Defaults to true.
     :param save_cover_image: Flag for declaring whether to save cover image.
         Defaults to true.
+    :param model_hash: SHA256 hash of the model file, already retrieved.
+        Defaults to None in which case the hash is read from the hash file or computed.
+    :param model_version_metadata: Model version metadata, already resolved via a batched hash lookup.
+        Defaults to None in which case the metadata is fetched by hash.
+    :param database: Database for looking up and storing model and model version metadata.
+        It is checked before metadata files and the API, metadata files are still written for external tools.
+        Defaults to None in which case metadata files are checked before fetching.
     :return: Hash, model version metadata, model metadata and cover image path.
     """
     # check preconditions
@@ -63,39 +142,57 @@ def download_data_for_model_file(wrapper: CivitaiAPIWrapper,
         wrapper.logger.warning(f"File extension of '{model_file_path}' is not in {MODEL_EXTENSIONS}, skipping...")
         return None, None, None, None
     
-    model_hash_path = os.path.join(directory, f"{file_name}.hash")
     model_version_metadata_path = os.path.join(directory, f"{file_name}_model_version.json")
     model_metadata_path = os.path.join(directory, f"{file_name}_model.json")
 
     # handle hash
-    if not os.path.exists(model_hash_path):
-        hash = hashing_utility.hash_with_sha256(model_file_path)
-        if save_hash:
-            open(model_hash_path, "w").write(hash)
-    else:
-        hash = open(model_hash_path, "r").read()  
+    hash = get_hash_for_model_file(model_file_path=model_file_path, save_hash=save_hash) if model_hash is None else model_hash
             
-    # handle model version metadata
-    if not os.path.exists(model_version_metadata_path):
-        model_version_metadata = wrapper.safely_fetch_api_data(wrapper.model_version_by_hash_endpoint + f"/{hash}?nsfw=true")
-        if model_version_metadata:
-            if (skip_filename_check or any(entry["name"] == file for entry in model_version_metadata["files"])):
-                json_utility.save(model_version_metadata, model_version_metadata_path)
-            wrapper.logger.warning(f"Found metadata, but file name is not in {[entry['name'] for entry in model_version_metadata['files']]}")
-    else:
+    # handle model version metadata, preferring the database over metadata files and metadata files over the API
+    model_version_url = f"{wrapper.model_version_by_hash_endpoint}/{hash.upper()}"
+    if model_version_metadata is None and database is not None:
+        model_version_metadata = load_metadata_from_database(database, "modelversion", [model_version_url]).get(model_version_url)
+    model_version_metadata_exists = os.path.exists(model_version_metadata_path)
+    if model_version_metadata is None and model_version_metadata_exists:
         model_version_metadata = json_utility.load(model_version_metadata_path)
+        if model_version_metadata and database is not None:
+            save_metadata_to_database(database, "modelversion", {model_version_url: model_version_metadata})
+    if model_version_metadata is None:
+        model_version_metadata = wrapper.safely_fetch_api_data(wrapper.model_version_by_hash_endpoint + f"/{hash}?nsfw=true", cache=True)
+        if model_version_metadata and database is not None:
+            save_metadata_to_database(database, "modelversion", {model_version_url: model_version_metadata})
+    if model_version_metadata and not model_version_metadata_exists:
+        file_names = {entry["name"] for entry in model_version_metadata["files"]}
+        if skip_filename_check or file in file_names:
+            json_utility.save(model_version_metadata, model_version_metadata_path)
+        else:
+            wrapper.logger.warning(f"Found metadata, but file name is not in {file_names}")
 
     # handle model metadata
-    if not os.path.exists(model_metadata_path) and model_version_metadata:
-        model_metadata = wrapper.safely_fetch_api_data(f"{wrapper.model_api_endpoint}/{model_version_metadata['modelId']}")
-        if model_metadata and save_model_metadata:
+    model_metadata = None
+    if model_version_metadata:
+        model_url = f"{wrapper.model_api_endpoint}/{model_version_metadata['modelId']}"
+        if database is not None:
+            model_metadata = load_metadata_from_database(database, "model", [model_url]).get(model_url)
+        model_metadata_exists = os.path.exists(model_metadata_path)
+        if model_metadata is None and model_metadata_exists:
+            model_metadata = json_utility.load(model_metadata_path)
+            if model_metadata and database is not None:
+                save_metadata_to_database(database, "model", {model_url: model_metadata})
+        if model_metadata is None:
+            model_metadata = wrapper.safely_fetch_api_data(model_url, cache=True)
+            if model_metadata and database is not None:
+                save_metadata_to_database(database, "model", {model_url: model_metadata})
+        if model_metadata and save_model_metadata and not model_metadata_exists:
             json_utility.save(model_metadata, model_metadata_path)
-    else:
+    elif os.path.exists(model_metadata_path):
         model_metadata = json_utility.load(model_metadata_path)
 
     # handle cover image
+    image_path = None
     if save_cover_image and model_version_metadata:
-        image_path = wrapper.download_image_for_model_file(
+        image_path = download_image_for_model_file(
+            wrapper=wrapper,
             directory=directory,
             file_name=file_name,
             model_version_metadata=model_version_metadata
@@ -121,27 +218,138 @@ def download_image_for_model_file(wrapper: CivitaiAPIWrapper,
             image_data = options[0]
             image_url_parts = image_data["url"].replace("https://image.civitai.com/", "").split("/")
             image_file_ext = os.path.splitext(image_url_parts[-1])[1]
-            if image_file_ext not in IMG_EXTS and wrapper.logger:
+            image_path = None
+            if image_file_ext.lower() not in IMG_EXTS and wrapper.logger:
                 wrapper.logger.warning(f"Unsupported extension for image download: '{image_file_ext}'")
             else:
                 image_path = os.path.join(directory, f"{file_name}{image_file_ext}")
-                tries = 0
-                while not image_utility.check_image_health(image_path) and tries <= len(IMG_WIDTHS):
-                    wrapper.logger.info(f"'{image_path}' not existing or invalid, downloading ...")
-                    if not wrapper.download_asset(
-                        asset_url=fix_image_url(image_data, width=None if tries == 0 else IMG_WIDTHS[tries - 1]),
-                        output_path=image_path):
-                        while not internet_utility.check_connection():
-                            wrapper.logger.info(f"Waiting for internet connection...")
-                            internet_utility.wait_for_connection()
-                        tries += 1
+                if not image_utility.check_image_health_fast(image_path):
+                    format_image_url = make_image_url_formatter(image_data)
+                    # try original width first, fall back to smaller widths
+                    for width in [None, *IMG_WIDTHS]:
+                        wrapper.logger.info(f"'{image_path}' not existing or invalid, downloading ...")
+                        if wrapper.download_asset(
+                            asset_url=format_image_url(width),
+                            output_path=image_path):
+                            if image_utility.check_image_health_fast(image_path):
+                                break
+                        else:
+                            while not internet_utility.check_connection():
+                                wrapper.logger.info(f"Waiting for internet connection...")
+                                internet_utility.wait_for_connection()
                 if not os.path.exists(image_path):
                     image_path = None
             return image_path
     return None
 
 
+def hash_model_files(model_file_paths: List[str], 
+                     max_workers: int | None = None, 
+                     use_processes: bool = True,
+                     save_hash: bool = True,
+                     hash_index: HashIndex | None = None,
+                     logger: Any = LOGGER) -> Dict[str, str]:
+    """
+    Retrieves the SHA256 hashes for multiple model files in parallel.
+    :param model_file_paths: Paths of the model files.
+    :param max_workers: Maximum number of files to hash concurrently.
+        Defaults to None in which case half of the available CPU cores are used.
+    :param use_processes: Flag for declaring whether to hash in worker processes instead of threads.
+        Defaults to true.
+    :param save_hash: Flag for declaring whether to save hashes.
+        Defaults to true.
+    :param hash_index: Hash index for skipping files that did not change since they were last hashed.
+        Defaults to None.
+    :param logger: Logger for reporting failed files.
+        Defaults to the configured logger.
+    :return: Dictionary, mapping model file paths to hashes.
+    """
+    max_workers = max(1, (os.cpu_count() or 2) // 2) if max_workers is None else max_workers
+    stat_results = {}
+    for file_path in model_file_paths:
+        try:
+            stat_results[file_path] = os.stat(file_path)
+        except OSError as ex:
+            logger.warning(f"Hashing '{file_path}' failed ({ex}).")
+    hashes = {} if hash_index is None else hash_index.get_many(list(stat_results), stat_results=stat_results)
+    new_hashes = {}
+    with (ProcessPoolExecutor if use_processes else ThreadPoolExecutor)(max_workers=max_workers) as executor:
+        futures = {executor.submit(get_hash_for_model_file, model_file_path=file_path, save_hash=save_hash): file_path 
+                   for file_path in stat_results if file_path not in hashes}
+        for future in tqdm(as_completed(futures), total=len(futures), leave=False):
+            try:
+                new_hashes[futures[future]] = future.result()
+            except Exception as ex:
+                logger.warning(f"Hashing '{futures[future]}' failed ({ex}).")
+    if hash_index is not None:
+        hash_index.put_many(new_hashes, stat_results=stat_results)
+    hashes.update(new_hashes)
+    return hashes
+
+
+def download_data_for_model_folder(wrapper: CivitaiAPIWrapper,
+                                   model_folder: str,
+                                   max_workers: int = 8,
+                                   max_hash_workers: int | None = None,
+                                   hash_in_processes: bool = True,
+                                   hash_index: HashIndex | None = None,
+                                   database: BasicSQLAlchemyInterface | None = None,
+                                   **kwargs: Optional[dict]) -> None:
+    """
+    Downloads additional data for all model files in a folder.
+    Model files are hashed first, so that missing model version metadata can be looked up in batches.
+    Files are processed concurrently, API requests are spaced by the wrapper's rate limiter.
+    :param wrapper: API wrapper.
+    :param model_folder: Model folder.
+    :param max_workers: Maximum number of files to process concurrently.
+        Defaults to 8.
+    :param max_hash_workers: Maximum number of files to hash concurrently.
+        Defaults to None in which case half of the available CPU cores are used.
+    :param hash_in_processes: Flag for declaring whether to hash in worker processes instead of threads.
+        Defaults to true.
+    :param hash_index: Hash index for skipping files that did not change since they were last hashed.
+        Defaults to None.
+    :param database: Database for looking up and storing model and model version metadata.
+        It is checked before metadata files and the API.
+        Defaults to None in which case metadata files are checked before fetching.
+    :param kwargs: Arbitrary keyword arguments, handed to download_data_for_model_file.
+    """
+    file_paths = list(file_system_utility.iter_files(model_folder, extensions=MODEL_EXTENSIONS))
+    hashes = hash_model_files(model_file_paths=file_paths, 
+                              max_workers=max_hash_workers, 
+                              use_processes=hash_in_processes, 
+                              save_hash=kwargs.get("save_hash", True),
+                              hash_index=hash_index,
+                              logger=wrapper.logger)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        model_versions = {}
+        if database is not None:
+            model_versions = {url.rsplit("/", 1)[-1]: entry for url, entry in load_metadata_from_database(
+                database, "modelversion", [f"{wrapper.model_version_by_hash_endpoint}/{hash.upper()}" for hash in hashes.values()]).items()}
+        missing_hashes = {hash.upper() for file_path, hash in hashes.items() 
+                          if hash.upper() not in model_versions and not os.path.exists(f"{os.path.splitext(file_path)[0]}_model_version.json")}
+        fetched_model_versions = wrapper.fetch_model_versions_by_hashes(list(missing_hashes))
+        if database is not None:
+            save_metadata_to_database(database, "modelversion", {f"{wrapper.model_version_by_hash_endpoint}/{hash}": entry 
+                                                                 for hash, entry in fetched_model_versions.items() if entry})
+        model_versions.update(fetched_model_versions)
+        futures = {executor.submit(download_data_for_model_file, 
+                                   wrapper=wrapper, 
+                                   model_file_path=file_path, 
+                                   model_hash=hash,
+                                   model_version_metadata=model_versions.get(hash.upper()),
+                                   database=database,
+                                   **kwargs): file_path 
+                   for file_path, hash in hashes.items()}
+        for future in tqdm(as_completed(futures), total=len(futures), leave=False):
+            try:
+                future.result()
+            except Exception as ex:
+                wrapper.logger.warning(f"Downloading data for '{futures[future]}' failed ({ex}).")
+
+
 if __name__ == "__main__":
+    ensure_folders()
     # Create an API key via civitai user account settings and replace "MyAPIKey" under src/configuration/config.py
     wrapper = CivitaiAPIWrapper(
         api_key=API_KEY,
@@ -149,9 +357,13 @@ if __name__ == "__main__":
         logger_overwrite=LOGGER
     )
     # Replace DATA_FOLDER by your model folder below to start downloading metadata for the model files in this folder
-    for root, dirs, files in os.walk(DATA_FOLDER, topdown=True):
-        for file in files:
-            download_data_for_model_file(
-                wrapper=wrapper,
-                model_file_path=os.path.join(root, file)
-            )
+    download_data_for_model_folder(
+        wrapper=wrapper,
+        model_folder=DATA_FOLDER,
+        hash_index=HashIndex(DATABASE_FOLDER),
+        database=BasicSQLAlchemyInterface(
+            working_directory=DATABASE_FOLDER,
+            population_function=populate_data_infrastructure,
+            default_entries=get_default_entries()
+        )
+    )
@@ -6,17 +6,40 @@
 ****************************************************
 """
 import os
-import copy
+import re
+import orjson
 from tqdm import tqdm
-import requests
-from typing import List, Any
-import shutil
-from time import sleep
+from typing import List, Any, Dict, Set
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from sqlalchemy import select, update, bindparam, func, cast
+from sqlalchemy.dialects.postgresql import JSONB
 from src.database.basic_sqlalchemy_interface import BasicSQLAlchemyInterface, FilterMask
-from src.database.data_model import populate_data_infrastructure, get_default_entries
+from src.database.data_model import populate_data_infrastructure, get_default_entries, get_model_columns
+from src.database.raw_response_store import RawResponseStore
 from src.model.civitai_api_wrapper import CivitaiAPIWrapper
-from src.configuration.config import LOGGER, API_KEY, RAW_RESPONSE_FOLDER, DATABASE_FOLDER, IMAGE_FOLDER
-from src.utility import json_utility, internet_utility
+from src.configuration.config import LOGGER, API_KEY, RAW_RESPONSE_FOLDER, DATABASE_FOLDER, IMAGE_FOLDER, ensure_folders
+from src.utility import json_utility, internet_utility, time_utility
+
+
+IMG_WIDTH_PATTERN = re.compile(r"/width=[^/]*", re.IGNORECASE)
+
+
+def decode_response_items(body: bytes) -> List[dict] | None:
+    """
+    Decodes the entries of a compressed raw response.
+    :param body: Compressed response body.
+    :return: Response entries or None, if the response could not be decoded.
+    """
+    try:
+        data = RawResponseStore.decode(body)
+    except Exception:
+        return None
+    if "items" in data:
+        return data["items"]
+    elif "id" in data:
+        return [data]
+    return []
 
 
 class MetadataScraper(object):
@@ -27,17 +50,26 @@ class MetadataScraper(object):
     def __init__(self,
                 wrapper: CivitaiAPIWrapper,
                 database: BasicSQLAlchemyInterface,
-                image_folder: str | None = None) -> None:
+                image_folder: str | None = None,
+                max_download_workers: int = 8,
+                download_wait_time: float = 0.25) -> None:
             """
             Initiation method.
             :param wrapper: Civitai API wrapper.
             :param database: Database to write metadata to.
             :param image_folder: Folder to save images in.
                 Defaults to None in which case images are not saved.
+            :param max_download_workers: Maximum number of concurrent image downloads.
+                Defaults to 8.
+            :param download_wait_time: Minimum time in seconds between starting two image downloads.
+                Defaults to 0.25.
             """
             self.wrapper = wrapper
             self.database = database
             self.image_folder = image_folder
+            self.max_download_workers = max_download_workers
+            self.download_rate_limiter = time_utility.RateLimiter(download_wait_time)
+            self.known_urls = {}
             if self.image_folder:
                 os.makedirs(self.image_folder, exist_ok=True)
 
@@ -52,24 +84,72 @@ class MetadataScraper(object):
                 "models": "https://civitai.com/api/v1/models/", 
                 "images": "https://civitai.com/api/v1/images/"}[asset_type]
         
-        patching_method = {
-                "models": self.post_or_patch_model_entry, 
-                "images": self.post_or_patch_image_entry}[asset_type]
-
         def callback(entries: List[Any]) -> None:
-            for entry in entries:
-                try:
-                    url = entry_url_base + str(entry["id"])
-                    patching_method(url=url, entry=entry)
-                except Exception as ex:
-                    wrapper.logger.warning(f"Process failed for {asset_type} entry {entry['id']} ({ex})...")
+            self.post_or_patch_entries(
+                asset_type=asset_type,
+                entries={entry_url_base + str(entry["id"]): entry for entry in entries}
+            )
 
         self.wrapper.scrape_available_asset_metadata(
             asset_type=asset_type, 
             callback=callback, 
             start_url=start_url
         )
-         
+
+    def _get_known_urls(self, object_type: str) -> Set[str]:
+        """
+        Internal method for getting the URLs of all existing entries.
+        The URLs are loaded with a single query on first access and kept up to date afterwards.
+        :param object_type: Target object type.
+        :return: Set of known URLs.
+        """
+        if object_type not in self.known_urls:
+            with self.database.session_factory() as session:
+                self.known_urls[object_type] = set(session.scalars(select(self.database.model[object_type].url)))
+        return self.known_urls[object_type]
+
+    def _prefetch(self, object_type: str, urls: List[str]) -> Dict[str, Any]:
+        """
+        Internal method for fetching already existing entries with a single query.
+        :param object_type: Target object type.
+        :param urls: Entry URLs.
+        :return: Dictionary, mapping URLs to existing objects.
+        """
+        if not urls:
+            return {}
+        return {obj.url: obj for obj in self.database.get_objects_by_filtermasks(
+            object_type, [FilterMask([["url", "in", urls]])])}
+
+    def post_or_patch_entries(self, asset_type: str, entries: Dict[str, dict]) -> None:
+        """
+        Posts or patches a batch of entries.
+        :param asset_type: Asset type out of ["models", "images"].
+        :param entries: Dictionary, mapping entry URLs to entry data.
+        """
+        object_type = {"models": "model", "images": "image"}[asset_type]
+        known_urls = self._get_known_urls(object_type)
+        # Only existing model entries need to be fetched for merging, existing image entries are skipped
+        existing = self._prefetch(object_type, [url for url in entries if url in known_urls]) if asset_type == "models" else {}
+        new_rows = []
+        patches = {}
+        for url, entry in entries.items():
+            try:
+                if url not in known_urls:
+                    new_rows.append({"models": self._create_model_row, 
+                                     "images": self._create_image_row}[asset_type](url=url, entry=entry))
+                elif url in existing and self._merge_model_entry(reference_entry=existing[url].data, entry=entry):
+                    patches[getattr(existing[url], self.database.primary_keys[object_type])] = entry
+            except Exception as ex:
+                self.wrapper.logger.warning(f"Process failed for {asset_type} entry {entry.get('id')} ({ex})...")
+        if asset_type == "images" and self.image_folder:
+            self._download_images(rows=new_rows)
+        try:
+            with self.database.transaction() as session:
+                self.database.bulk_upsert(object_type, new_rows, session=session)
+                self._patch_model_versions(entries=patches, session=session)
+            known_urls.update(row["url"] for row in new_rows)
+        except Exception as ex:
+            self.wrapper.logger.warning(f"Writing {len(new_rows)} new and {len(patches)} patched {asset_type} entries failed ({ex})...")
 
     def post_or_patch_model_entry(self, url: str, entry: dict) -> None:
         """
@@ -77,45 +157,79 @@ class MetadataScraper(object):
         :param url: Entry URL.
         :param data: Entry data.
         """
-        obj = self.database.get_objects_by_filtermasks(
-                    "model", [FilterMask(
-                        [["url", "==", url]])]
-                )
-        if obj:
-            # Entry already existing, merge in new model versions if there are any
-            reference_entry = obj[0].data
-            patched = False
-            for mv_data in reference_entry["modelVersions"]:
-                if not any(updated_mv_data["id"] == mv_data["id"] for updated_mv_data in entry["modelVersions"]):
-                    entry["modelVersions"].append(copy.deepcopy(mv_data))
-                    patched = True
-            if patched:
-                print(f"\tFound additional model versions for model {entry['id']}, patching...")
-                self.database.patch_object("model", obj[0].id, data=entry)
+        self.post_or_patch_entries(asset_type="models", entries={url: entry})
+
+    def _merge_model_entry(self, reference_entry: dict, entry: dict) -> bool:
+        """
+        Internal method for merging model versions of an existing model entry into a new entry.
+        :param reference_entry: Existing model entry.
+        :param entry: Entry data.
+        :return: True, if model versions were merged in and the existing entry needs patching, else False.
+        """
+        existing_ids = {mv_data["id"] for mv_data in entry["modelVersions"]}
+        # The merged entry is written to the database right away, so model versions can be shared without copying
+        missing = [mv_data for mv_data in reference_entry["modelVersions"] if mv_data["id"] not in existing_ids]
+        if missing:
+            entry["modelVersions"].extend(missing)
+            print(f"\tFound additional model versions for model {entry['id']}, patching...")
+        return bool(missing)
+
+    def _patch_model_versions(self, entries: Dict[Any, dict], session: Any) -> None:
+        """
+        Internal method for patching the model versions of existing model entries with a single batched statement.
+        On SQLite and PostgreSQL only the model versions are replaced via json_set or jsonb_set, 
+            other backends re-write the full metadata.
+        :param entries: Dictionary, mapping model object IDs to merged model entries.
+        :param session: Session of an ongoing transaction.
+        """
+        if not entries:
+            return
+        table = self.database.model["model"].__table__
+        dialect = session.get_bind().dialect.name
+        if dialect == "sqlite":
+            data = func.json_set(table.c.data, "$.modelVersions", func.json(bindparam("model_versions")))
+        elif dialect == "postgresql":
+            data = func.jsonb_set(table.c.data, "{modelVersions}", cast(bindparam("model_versions"), JSONB))
         else:
-            print(f"\tFound new model {entry['id']}, adding...")
-            self.database.post_object(
-                "model", 
-                url=url,
-                source="civitai.com",
-                data=entry,
-                state="full")   
+            data = bindparam("data", type_=table.c.data.type)
+        session.execute(
+            update(table).where(table.c[self.database.primary_keys["model"]] == bindparam("object_id")).values(
+                data=data,
+                version_count=bindparam("version_count"),
+                updated=func.now()),
+            [{"object_id": object_id, 
+              "model_versions": orjson.dumps(entry["modelVersions"]).decode(), 
+              "data": entry,
+              "version_count": len(entry["modelVersions"])} for object_id, entry in entries.items()]
+        )
+
+    def _create_model_row(self, url: str, entry: dict) -> dict:
+        """
+        Internal method for creating the database row of a new model entry.
+        :param url: Entry URL.
+        :param entry: Entry data.
+        :return: Model row.
+        """
+        print(f"\tFound new model {entry['id']}, adding...")
+        return {
+            "url": url,
+            "source": "civitai.com",
+            "data": entry,
+            **get_model_columns(entry),
+            "state": "full"
+        }
 
     @internet_utility.timeout(180.0)
-    def save_image_to_disk(self, url: str, image_folder: str) -> str:
+    def save_image_to_disk(self, url: str, image_folder: str) -> str | None:
         """
         Function for downloading image to disk.
         :param url: Image URL.
         :param image_folder: Image folder.
-        :return: File path.
+        :return: File path, if download was successful.
         """
         file_path = os.path.join(image_folder, url.split("/")[-1])
-        download = requests.get(url, stream=True, headers=self.wrapper.headers)
-        with open(file_path, 'wb') as file:
-            shutil.copyfileobj(download.raw, file)
-        del download
-        sleep(1)
-        return file_path
+        self.download_rate_limiter.wait()
+        return file_path if self.wrapper.download_asset(asset_url=url, output_path=file_path) else None
 
     def post_or_patch_image_entry(self, url: str, entry: dict) -> None:
         """
@@ -123,24 +237,40 @@ class MetadataScraper(object):
         :param url: Entry URL.
         :param data: Entry data.
         """
-        obj = self.database.get_objects_by_filtermasks(
-                    "image", [FilterMask(
-                        [["url", "==", url]])]
-                )
-        
-        if not obj:
-            print(f"\tFound new image {entry['id']}, adding...")
-            file_path = None
-            if self.image_folder:
-                file_path = self.save_image_to_disk(url=entry["url"], image_folder=self.image_folder)
-            self.database.post_object(
-                "image", 
-                url=url,
-                source="civitai.com",
-                data=entry,
-                path=file_path,
-                state="full",
-            )
+        self.post_or_patch_entries(asset_type="images", entries={url: entry})
+
+    def _create_image_row(self, url: str, entry: dict) -> dict:
+        """
+        Internal method for creating the database row of a new image entry.
+        :param url: Entry URL.
+        :param entry: Entry data.
+        :return: Image row.
+        """
+        print(f"\tFound new image {entry['id']}, adding...")
+        return {
+            "url": url,
+            "source": "civitai.com",
+            "data": entry,
+            "path": None,
+            "state": "full"
+        }
+
+    def _download_images(self, rows: List[dict]) -> None:
+        """
+        Internal method for concurrently downloading the images of new image rows.
+        The image paths of the rows are set for successful downloads.
+        :param rows: Image rows.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_download_workers) as executor:
+            futures = {executor.submit(self.save_image_to_disk, url=row["data"]["url"], image_folder=self.image_folder): row 
+                       for row in rows}
+            for future in as_completed(futures):
+                try:
+                    file_path = future.result()
+                    if file_path is not None:
+                        futures[future]["path"] = file_path
+                except Exception as ex:
+                    self.wrapper.logger.warning(f"Downloading image {futures[future]['data'].get('id')} failed ({ex})...")
             
     def get_url_for_asset(self, asset_type: str, entry: dict) -> str:
         """
@@ -152,8 +282,7 @@ class MetadataScraper(object):
         if asset_type == "models":
             return f"https://civitai.com/api/v1/models/{entry['id']}"
         elif asset_type == "images":
-            image_url_parts =  [part for part in entry["url"].split("/") if not part.lower().startswith("width=")]
-            return "/".join(image_url_parts)
+            return IMG_WIDTH_PATTERN.sub("", entry["url"])
 
     def import_response_file(self, file_path: str, asset_type: str = "models") -> None:
         """
@@ -166,34 +295,71 @@ class MetadataScraper(object):
         except:
             print(f"\n\tFile {file_path} could not be loaded...\n")
             data = {}
-        
+        self.import_response_data(data=data, asset_type=asset_type, source=file_path)
+
+    def import_response_data(self, data: dict, asset_type: str = "models", source: str = "Response") -> None:
+        """
+        Imports the data of a specific response.
+        :param data: Response data.
+        :param asset_type: Asset type out of ["models", "images"].
+        :param source: Source of the response for logging purposes.
+        """
         patching_method = {
                 "models": self.post_or_patch_model_entry, 
                 "images": self.post_or_patch_image_entry}[asset_type]
         
         try:
             if "items" in data:
-                for index, entry in enumerate(tqdm(data["items"], desc=f"Importing {asset_type} entries...", unit="entry", leave=False)):
-                    url = self.get_url_for_asset(asset_type=asset_type, entry=entry)
-                    patching_method(url=url, entry=entry)
+                self.post_or_patch_entries(
+                    asset_type=asset_type,
+                    entries={self.get_url_for_asset(asset_type=asset_type, entry=entry): entry for entry in data["items"]}
+                )
             elif "id" in data:
-                url = self.get_url_for_asset(asset_type=asset_type, entry=entry)
+                url = self.get_url_for_asset(asset_type=asset_type, entry=data)
                 patching_method(url=url, entry=data)
             else:
-                print(f"\n\tFile {file_path}: entry {entry['id']} could not be imported...\n")
+                print(f"\n\t{source} could not be imported...\n")
         except:
-            print(f"\n\tFile {file_path}: entry {entry['id']} could not be imported...\n")
+            print(f"\n\t{source} could not be imported...\n")
 
-    def import_response_folder(self, path: str = RAW_RESPONSE_FOLDER, asset_type: str = "models") -> None:
+    def import_response_folder(self, path: str = RAW_RESPONSE_FOLDER, asset_type: str = "models", batch_size: int = 1000, max_workers: int | None = None) -> None:
         """
-        Imports raw response folder.
+        Imports raw responses from the response store in the given folder.
+        Responses are decoded in parallel processes, while entries are written in batches from the main process.
+        Only responses from the API endpoint of the given asset type are imported.
+        Single response json files can be imported via 'import_response_file'.
         :param path: Folder path.
         :param asset_type: Asset type out of ["models", "images"].
+        :param batch_size: Number of entries to collect before writing them to the database.
+            Defaults to 1000.
+        :param max_workers: Maximum number of decoding processes.
+            Defaults to None in which case the number of processors is used.
         """
-        for root, _, files in os.walk(path):
-            for file in tqdm(files, desc="Loading response files...", unit="file", leave=False):
-                file_path = os.path.join(root, file)
-                self.import_response_file(file_path=file_path)
+        endpoint = {"models": self.wrapper.model_api_endpoint, "images": self.wrapper.image_api_endpoint}[asset_type]
+        store = RawResponseStore(path)
+        rows = store.iter_raw()
+        queue = {}
+        progress_bar = tqdm(desc="Loading responses...", unit="response", total=len(store), leave=False)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            while chunk := list(islice(rows, 256)):
+                progress_bar.update(len(chunk))
+                chunk = [(url, body) for url, body in chunk if url.startswith((f"{endpoint}?", f"{endpoint}/"))]
+                for (url, _), items in zip(chunk, executor.map(decode_response_items, [body for _, body in chunk], chunksize=16)):
+                    if items is None:
+                        print(f"\n\tResponse for '{url}' could not be imported...\n")
+                    for entry in items or []:
+                        if asset_type == "models" and "modelVersions" not in entry:
+                            continue
+                        entry_url = self.get_url_for_asset(asset_type=asset_type, entry=entry)
+                        if asset_type == "models" and entry_url in queue:
+                            self._merge_model_entry(reference_entry=queue[entry_url], entry=entry)
+                        queue[entry_url] = entry
+                    if len(queue) >= batch_size:
+                        self.post_or_patch_entries(asset_type=asset_type, entries=queue)
+                        queue = {}
+        if queue:
+            self.post_or_patch_entries(asset_type=asset_type, entries=queue)
+        store.close()
 
     def get_cover_images(self, output_path: str) -> None:
         """
@@ -202,7 +368,7 @@ class MetadataScraper(object):
         """
         raise NotImplementedError("'get_cover_images' is not implemented yet.")
         with self.database.session_factory() as session:
-            progress_bar = tqdm(desc="Iterating over model entries...", unit="models", total=database.get_object_count_by_type("model"), leave=False)
+            progress_bar = tqdm(desc="Iterating over model entries...", unit="models", total=self.database.count_cache.get("model"), leave=False)
             for obj in session.query(database.model["model"]).yield_per(50):
                 model = obj.data
                 for model_version in tqdm(model["modelVersions"], desc="Iterating over model version entries...", unit="model versions", leave=False):
@@ -211,6 +377,7 @@ class MetadataScraper(object):
 
 
 if __name__ == "__main__":
+    ensure_folders()
     # Create an API key via civitai user account settings and replace "MyAPIKey" under src/configuration/config.py
     wrapper = CivitaiAPIWrapper(
         api_key=API_KEY,
@@ -6,13 +6,14 @@
 ****************************************************
 """
 import os
+from pathlib import Path
 from dotenv import dotenv_values
 import logging
 logging.basicConfig(level=logging.INFO, format="(%(asctime)s)[CivitaiScraping][%(levelname)s] %(message)s")
 LOGGER = logging
 
 
-PROJECT_FOLDER = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+PROJECT_FOLDER = str(Path(__file__).resolve().parents[2])
 ENV_PATH = os.path.join(PROJECT_FOLDER, ".env")
 ENV = dotenv_values(ENV_PATH) if os.path.exists(ENV_PATH) else {}
 
@@ -29,8 +30,19 @@ DATABASE_FOLDER = os.path.join(DATA_FOLDER, "database")
 IMAGE_FOLDER = os.path.join(DATA_FOLDER, "images")
 
 
-for folder in [RAW_RESPONSE_FOLDER, DATABASE_FOLDER, IMAGE_FOLDER]:
-    os.makedirs(folder, exist_ok=True)
+_FOLDERS_ENSURED = False
+
+
+def ensure_folders() -> None:
+    """
+    Function for creating the additional folders.
+    Folders are only created on the first call per process.
+    """
+    global _FOLDERS_ENSURED
+    if not _FOLDERS_ENSURED:
+        for folder in [RAW_RESPONSE_FOLDER, DATABASE_FOLDER, IMAGE_FOLDER]:
+            os.makedirs(folder, exist_ok=True)
+        _FOLDERS_ENSURED = True
 
 
 if API_KEY == "MyAPIKey":
@@ -6,12 +6,13 @@
 ****************************************************
 """
 import os
+from contextlib import contextmanager, nullcontext
 from src.utility.filter_mask_utility import FilterMask
 from src.utility import sqlalchemy_utility
 from src.utility import time_utility
 from uuid import UUID
 from datetime import datetime as dt
-from typing import Optional, Any, List, Dict
+from typing import Optional, Any, List, Dict, Generator
 
 
 class BasicSQLAlchemyInterface(object):
@@ -51,6 +52,7 @@ class BasicSQLAlchemyInterface(object):
         self.schema = schema
         self.session_factory = None
         self.primary_keys = None
+        self.count_cache = {}
         self._setup_database()
 
     def _setup_database(self) -> None:
@@ -60,7 +62,14 @@ class BasicSQLAlchemyInterface(object):
         if self.logger is not None:
             self.logger.info("Automapping existing structures")
         self.base = sqlalchemy_utility.automap_base()
-        self.engine = sqlalchemy_utility.get_engine(self.database_uri)
+        self.engine = sqlalchemy_utility.get_engine(self.database_uri, **sqlalchemy_utility.get_pool_kwargs(self.database_uri))
+        if self.engine.dialect.name == "sqlite":
+            sqlalchemy_utility.register_sqlite_pragmas(self.engine, {
+                "journal_mode": "WAL",
+                "synchronous": "NORMAL",
+                "temp_store": "MEMORY",
+                "mmap_size": 268435456
+            })
         self.base.prepare(autoload_with=self.engine, reflect=True)
         self.model = sqlalchemy_utility.get_classes_from_base(self.base)
         if self.schema:
@@ -186,11 +195,15 @@ class BasicSQLAlchemyInterface(object):
     def get_object_count_by_type(self, object_type: str) -> int:
         """
         Method for acquiring object count.
+        Counts are cached until objects of the given type are added or deleted via this interface.
         :param object_type: Target object type.
         :return: Number of objects.
         """
-        return int(self.engine.connect().execute(sqlalchemy_utility.select(sqlalchemy_utility.func.count()).select_from(
-            self.model[object_type])).scalar())
+        if object_type not in self.count_cache:
+            with self.engine.connect() as connection:
+                self.count_cache[object_type] = int(connection.execute(sqlalchemy_utility.select(sqlalchemy_utility.func.count()).select_from(
+                    self.model[object_type])).scalar())
+        return self.count_cache[object_type]
 
     def get_objects_by_type(self, object_type: str) -> List[Any]:
         """
@@ -238,8 +251,63 @@ class BasicSQLAlchemyInterface(object):
             session.add(obj)
             session.commit()
             session.refresh(obj)
+        self.count_cache.pop(object_type, None)
         return obj
 
+    @contextmanager
+    def transaction(self) -> Generator[Any, None, None]:
+        """
+        Context manager for bundling multiple operations into a single transaction.
+        The transaction is committed on exit and rolled back on errors.
+        :return: Session to pass on to methods, supporting a given session.
+        """
+        with self.session_factory() as session:
+            with session.begin():
+                yield session
+
+    def bulk_post(self, object_type: str, rows: List[dict], session: Any = None) -> None:
+        """
+        Method for adding multiple objects with a single batched statement.
+        :param object_type: Target object type.
+        :param rows: List of object attribute dictionaries.
+        :param session: Session of an ongoing transaction.
+            Defaults to None in which case a separate transaction is committed.
+        """
+        if not rows:
+            return
+        with self.transaction() if session is None else nullcontext(session) as session:
+            session.execute(sqlalchemy_utility.insert(self.model[object_type]).execution_options(
+                insertmanyvalues_page_size=1000), rows)
+        self.count_cache.pop(object_type, None)
+
+    def bulk_upsert(self, object_type: str, rows: List[dict], index_elements: List[str] | None = None, session: Any = None) -> None:
+        """
+        Method for adding or updating multiple objects with a single batched "INSERT ... ON CONFLICT DO UPDATE" statement.
+        Conflicting objects get all given attributes except for the index elements updated.
+        Falls back to plain bulk inserts for dialects without "ON CONFLICT" support.
+        :param object_type: Target object type.
+        :param rows: List of object attribute dictionaries with matching keys.
+        :param index_elements: Unique columns to detect conflicts on.
+            Defaults to None in which case the "url" column is used.
+        :param session: Session of an ongoing transaction.
+            Defaults to None in which case a separate transaction is committed.
+        """
+        if not rows:
+            return
+        index_elements = ["url"] if index_elements is None else index_elements
+        insert = sqlalchemy_utility.UPSERT_INSERTS.get(self.engine.dialect.name)
+        if insert is None:
+            return self.bulk_post(object_type, rows, session=session)
+        model = self.model[object_type]
+        statement = insert(model)
+        update_values = {column: statement.excluded[column] for column in rows[0] if column not in index_elements}
+        if hasattr(model, "updated"):
+            update_values["updated"] = sqlalchemy_utility.func.now()
+        statement = statement.on_conflict_do_update(index_elements=index_elements, set_=update_values) if update_values else statement.on_conflict_do_nothing(index_elements=index_elements)
+        with self.transaction() if session is None else nullcontext(session) as session:
+            session.execute(statement.execution_options(insertmanyvalues_page_size=1000), rows)
+        self.count_cache.pop(object_type, None)
+
     def patch_object(self, object_type: str, object_id: Any, **object_attributes: Optional[Any]) -> Optional[Any]:
         """
         Method for patching an object.
@@ -284,6 +352,7 @@ class BasicSQLAlchemyInterface(object):
                 else:
                     session.delete(obj)
                 session.commit()
+        self.count_cache.pop(object_type, None)
         return obj
         
     def put_object(self, object_type: str, reference_attributes: List[str] = None,  **object_attributes: Optional[Any]) -> Optional[Any]:
@@ -6,14 +6,30 @@
 ****************************************************
 """
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import Engine, Column, String, JSON, Integer, DateTime, func, Boolean
+from sqlalchemy import Engine, Column, String, JSON, Integer, DateTime, func, Boolean, Index, inspect, text
+from sqlalchemy import select, update, bindparam, cast
+from sqlalchemy.sql.functions import Function
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy_utils import UUIDType
+from src.utility import sqlalchemy_utility
 from uuid import uuid4
+from functools import lru_cache
+from typing import Any, Dict, Tuple
+
+
+# JSON type for metadata columns, stored as binary JSONB on PostgreSQL
+# SQLite keeps text JSON, since queries and patches rely on its JSON1 functions
+METADATA_JSON = JSON().with_variant(JSONB(), "postgresql")
+# Database URLs and schemas, which were already initialized in this process
+# In-memory databases are not tracked, since every engine gets its own database
+INITIALIZED_SCHEMAS = set()
 
 
 def populate_data_infrastructure(engine: Engine, schema: str, model: dict) -> None:
     """
     Function for populating data infrastructure.
+    Tables, migrations and indexes are only checked on the first call per database and schema in this process, 
+    in-memory databases are always checked.
     :param engine: Database engine.
     :param schema: Schema for tables.
     :param model: Model dictionary for holding data classes.
@@ -21,6 +37,28 @@ def populate_data_infrastructure(engine: Engine, schema: str, model: dict) -> No
     schema = str(schema)
     if schema and not schema.endswith("."):
         schema += "."
+    base, dataclasses = build_data_classes(schema)
+    model.update(dataclasses)
+
+    initialization_key = None if sqlalchemy_utility.is_in_memory_sqlite(engine.url) else (engine.url.render_as_string(hide_password=True), schema)
+    if initialization_key is None or initialization_key not in INITIALIZED_SCHEMAS:
+        base.metadata.create_all(bind=engine)
+        migrate_extracted_model_columns(engine=engine, model_class=dataclasses["model"])
+        for table in base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
+        if initialization_key is not None:
+            INITIALIZED_SCHEMAS.add(initialization_key)
+
+
+@lru_cache(maxsize=None)
+def build_data_classes(schema: str) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Function for building the data classes for a schema.
+    Data classes are built and mapped once per schema and reused for further databases.
+    :param schema: Schema prefix for tables.
+    :return: Declarative base and dictionary, mapping object types to data classes.
+    """
     base = declarative_base()
 
     class Model(base):
@@ -28,8 +66,10 @@ def populate_data_infrastructure(engine: Engine, schema: str, model: dict) -> No
         Log class, representing a model entry.
         """
         __tablename__ = f"{schema}model"
-        __table_args__ = {
-            "comment": "Model table.", "extend_existing": True}
+        __table_args__ = (
+            Index(f"ix_{schema.replace('.', '_')}model_state_source", "state", "source"),
+            Index(f"ix_{schema.replace('.', '_')}model_updated", "updated"),
+            {"comment": "Model table.", "extend_existing": True})
 
         uuid = Column(UUIDType(binary=False), primary_key=True, unique=True, nullable=False, default=uuid4,
                     comment="UUID of the entry.")
@@ -37,8 +77,14 @@ def populate_data_infrastructure(engine: Engine, schema: str, model: dict) -> No
                      comment="URL of the entry.")
         source = Column(String,
                      comment="Source of the entry.")
-        data = Column(JSON,
+        data = Column(METADATA_JSON,
                       comment="Metadata entry config.")
+        model_type = Column(String, index=True,
+                            comment="Model type, extracted from the metadata.")
+        civitai_id = Column(Integer, index=True, unique=True,
+                            comment="Civitai model ID, extracted from the metadata.")
+        version_count = Column(Integer,
+                               comment="Number of model versions, extracted from the metadata.")
         
         state = Column(String,
                      comment="State of the entry (full, extracted, ...).")
@@ -54,8 +100,10 @@ def populate_data_infrastructure(engine: Engine, schema: str, model: dict) -> No
         Log class, representing a model version entry.
         """
         __tablename__ = f"{schema}modelversion"
-        __table_args__ = {
-            "comment": "Model version table.", "extend_existing": True}
+        __table_args__ = (
+            Index(f"ix_{schema.replace('.', '_')}modelversion_state_source", "state", "source"),
+            Index(f"ix_{schema.replace('.', '_')}modelversion_updated", "updated"),
+            {"comment": "Model version table.", "extend_existing": True})
 
         uuid = Column(UUIDType(binary=False), primary_key=True, unique=True, nullable=False, default=uuid4,
                     comment="UUID of the entry.")
@@ -63,7 +111,7 @@ def populate_data_infrastructure(engine: Engine, schema: str, model: dict) -> No
                      comment="URL of the entry.")
         source = Column(String,
                      comment="Source of the entry.")
-        data = Column(JSON,
+        data = Column(METADATA_JSON,
                       comment="Metadata entry config.")
         
         state = Column(String,
@@ -80,8 +128,10 @@ def populate_data_infrastructure(engine: Engine, schema: str, model: dict) -> No
         Log class, representing an image entry.
         """
         __tablename__ = f"{schema}image"
-        __table_args__ = {
-            "comment": "Image table.", "extend_existing": True}
+        __table_args__ = (
+            Index(f"ix_{schema.replace('.', '_')}image_state_source", "state", "source"),
+            Index(f"ix_{schema.replace('.', '_')}image_updated", "updated"),
+            {"comment": "Image table.", "extend_existing": True})
 
         id = Column(UUIDType(binary=False), primary_key=True, unique=True, nullable=False, default=uuid4,
                     comment="UUID of the entry.")
@@ -89,7 +139,7 @@ def populate_data_infrastructure(engine: Engine, schema: str, model: dict) -> No
                      comment="URL of the entry.")
         source = Column(String,
                      comment="Source of the entry.")
-        data = Column(JSON,
+        data = Column(METADATA_JSON,
                       comment="Metadata entry config.")
         path = Column(String,
                      comment="Path of the image file.")
@@ -103,10 +153,74 @@ def populate_data_infrastructure(engine: Engine, schema: str, model: dict) -> No
         inactive = Column(Boolean, nullable=False, default=False,
                           comment="Inactivity flag.")
 
-    for dataclass in [Model, ModelVersion, Image]:
-        model[dataclass.__tablename__.replace(schema, "")] = dataclass
+    return base, {dataclass.__tablename__.replace(schema, ""): dataclass for dataclass in [Model, ModelVersion, Image]}
+
 
-    base.metadata.create_all(bind=engine)
+def migrate_extracted_model_columns(engine: Engine, model_class: Any) -> None:
+    """
+    Function for adding and filling the extracted metadata columns of model tables, which were created without them.
+    SQLite, PostgreSQL and MySQL fill the columns with a single statement, other backends fill them row by row.
+    :param engine: Database engine.
+    :param model_class: Model data class.
+    """
+    table = model_class.__table__
+    extracted_columns = ["model_type", "civitai_id", "version_count"]
+    existing_columns = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    missing_columns = [column for column in extracted_columns if column not in existing_columns]
+    if missing_columns:
+        preparer = engine.dialect.identifier_preparer
+        with engine.begin() as connection:
+            for column in missing_columns:
+                connection.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.quote(column)} "
+                                        f"{table.c[column].type.compile(engine.dialect)}"))
+            values = get_extracted_column_expressions(dialect=engine.dialect.name, data=table.c.data)
+            if values is not None:
+                connection.execute(update(table).values(**values))
+            else:
+                primary_key = table.primary_key.columns.values()[0]
+                rows = [{"object_id": object_id, **get_model_columns(data or {})} 
+                        for object_id, data in connection.execute(select(primary_key, table.c.data))]
+                if rows:
+                    connection.execute(
+                        update(table).where(primary_key == bindparam("object_id")).values(
+                            {column: bindparam(column) for column in extracted_columns}), rows)
+
+
+def get_extracted_column_expressions(dialect: str, data: Any) -> Dict[str, Any] | None:
+    """
+    Function for getting the SQL expressions for extracting the metadata columns of model entries.
+    :param dialect: Dialect name.
+    :param data: Metadata column.
+    :return: Dictionary, mapping column names to expressions or None, if the dialect is not supported.
+    """
+    if dialect == "sqlite":
+        return {"model_type": func.json_extract(data, "$.type"),
+                "civitai_id": func.json_extract(data, "$.id"),
+                # SQLAlchemy-Utils registers a PostgreSQL-only json_array_length function, so the SQL function is named directly
+                "version_count": Function("json_array_length", data, "$.modelVersions")}
+    elif dialect == "postgresql":
+        # Tables from before the switch to JSONB still hold JSON, so the model versions are cast for counting
+        return {"model_type": data.op("->>")("type"),
+                "civitai_id": cast(data.op("->>")("id"), Integer),
+                "version_count": func.jsonb_array_length(cast(data.op("->")("modelVersions"), JSONB))}
+    elif dialect in ("mysql", "mariadb"):
+        return {"model_type": func.json_unquote(func.json_extract(data, "$.type")),
+                "civitai_id": func.json_extract(data, "$.id"),
+                "version_count": func.json_length(data, "$.modelVersions")}
+    return None
+
+
+def get_model_columns(entry: dict) -> dict:
+    """
+    Function for extracting the metadata columns of a model entry.
+    :param entry: Model entry.
+    :return: Column values.
+    """
+    return {
+        "model_type": entry.get("type"),
+        "civitai_id": entry.get("id"),
+        "version_count": len(entry.get("modelVersions", []))
+    }
 
 
 def get_default_entries() -> dict:
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+****************************************************
+*                CivitAI Scraping                  *
+*            (c) 2025 Alexander Hering             *
+****************************************************
+"""
+import os
+from typing import Optional, Dict, List
+from src.database.sqlite_file_store import SQLiteFileStore
+
+
+DEFAULT_FILE_NAME = "hashes.db"
+
+
+class HashIndex(SQLiteFileStore):
+    """
+    Class, representing an index of file hashes, backed by a single SQLite file.
+    Hashes are keyed by file path and only returned while file size and modification time are unchanged.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initiation method.
+        :param path: Path of the SQLite file, ending in '.db', or a folder in which case the default file name is used.
+            Missing folders are created.
+        """
+        super().__init__(path=path, default_file_name=DEFAULT_FILE_NAME)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS hashes (path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, hash TEXT NOT NULL)")
+        self.connection.commit()
+
+    def get(self, file_path: str, stat_result: os.stat_result | None = None) -> Optional[str]:
+        """
+        Method for loading the hash of a file.
+        :param file_path: File path.
+        :param stat_result: Stat result of the file.
+            Defaults to None in which case the file is stat'ed.
+        :return: Hash, if found and the file did not change since hashing.
+        """
+        if stat_result is None:
+            try:
+                stat_result = os.stat(file_path)
+            except FileNotFoundError:
+                return None
+        with self._lock:
+            row = self.connection.execute("SELECT hash FROM hashes WHERE path = ? AND size = ? AND mtime_ns = ?", 
+                                          (file_path, stat_result.st_size, stat_result.st_mtime_ns)).fetchone()
+        return None if row is None else row[0]
+
+    def get_many(self, file_paths: List[str], stat_results: Dict[str, os.stat_result] | None = None) -> Dict[str, str]:
+        """
+        Method for loading the hashes of multiple files.
+        :param file_paths: File paths.
+        :param stat_results: Dictionary, mapping file paths to stat results.
+            Defaults to None in which case the files are stat'ed.
+        :return: Dictionary, mapping file paths to hashes for files that did not change since hashing.
+        """
+        stat_results = {} if stat_results is None else stat_results
+        result = {}
+        for file_path in file_paths:
+            hash = self.get(file_path, stat_results.get(file_path))
+            if hash is not None:
+                result[file_path] = hash
+        return result
+
+    def put_many(self, hashes: Dict[str, str], stat_results: Dict[str, os.stat_result] | None = None) -> None:
+        """
+        Method for saving the hashes of multiple files in a single transaction.
+        Stat results should be taken before hashing, so that files which changed while being hashed are hashed again later.
+        :param hashes: Dictionary, mapping file paths to hashes.
+        :param stat_results: Dictionary, mapping file paths to stat results.
+            Defaults to None in which case the files are stat'ed.
+        """
+        stat_results = {} if stat_results is None else stat_results
+        rows = []
+        for file_path, hash in hashes.items():
+            stat_result = stat_results.get(file_path)
+            if stat_result is None:
+                try:
+                    stat_result = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+            rows.append((file_path, stat_result.st_size, stat_result.st_mtime_ns, hash))
+        with self._lock:
+            self.connection.executemany("INSERT OR REPLACE INTO hashes (path, size, mtime_ns, hash) VALUES (?, ?, ?, ?)", rows)
+            self.connection.commit()
+
+    def put(self, file_path: str, hash: str, stat_result: os.stat_result | None = None) -> None:
+        """
+        Method for saving the hash of a file.
+        :param file_path: File path.
+        :param hash: Hash.
+        :param stat_result: Stat result of the file, taken before hashing.
+            Defaults to None in which case the file is stat'ed.
+        """
+        self.put_many({file_path: hash}, None if stat_result is None else {file_path: stat_result})
+
+    def __len__(self) -> int:
+        """
+        Method for counting indexed files.
+        :return: Number of indexed files.
+        """
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
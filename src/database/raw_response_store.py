@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+****************************************************
+*                CivitAI Scraping                  *
+*            (c) 2025 Alexander Hering             *
+****************************************************
+"""
+import gzip
+import hashlib
+import orjson
+from typing import Any, Optional, Generator, Tuple
+from src.database.sqlite_file_store import SQLiteFileStore
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+DEFAULT_FILE_NAME = "raw_responses.db"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+class RawResponseStore(SQLiteFileStore):
+    """
+    Class, representing a store for raw API responses, backed by a single SQLite file.
+    Responses are kept as zstd-compressed JSON, or gzip-compressed JSON if zstandard is not installed, 
+    under their URL, newer responses replace older ones.
+    Alongside, the HTTP validators (ETag and Last-Modified) are kept for conditional requests.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initiation method.
+        :param path: Path of the SQLite file, ending in '.db', or a folder in which case the default file name is used.
+            Missing folders are created.
+        """
+        super().__init__(path=path, default_file_name=DEFAULT_FILE_NAME)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS raw (url TEXT PRIMARY KEY, body BLOB NOT NULL, fetched TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(raw)")}
+        for column in ["checksum", "etag", "last_modified"]:
+            if column not in columns:
+                self.connection.execute(f"ALTER TABLE raw ADD COLUMN {column} TEXT")
+        # Lets iterations in fetching order stream rows instead of sorting the whole table first
+        self.connection.execute("CREATE INDEX IF NOT EXISTS raw_fetched ON raw (fetched)")
+        self.connection.commit()
+
+    @staticmethod
+    def compress(content: bytes) -> bytes:
+        """
+        Static method for compressing serialized response data.
+        :param content: Serialized response data.
+        :return: Compressed response body.
+        """
+        if zstandard is not None:
+            return zstandard.ZstdCompressor(level=3).compress(content)
+        return gzip.compress(content, compresslevel=6)
+
+    @staticmethod
+    def decompress(body: bytes) -> bytes:
+        """
+        Static method for decompressing a response body, compressed with either codec.
+        :param body: Compressed response body.
+        :return: Serialized response data.
+        """
+        if body.startswith(ZSTD_MAGIC):
+            if zstandard is None:
+                raise ImportError("Decompressing zstd-compressed responses requires the 'zstandard' package.")
+            return zstandard.ZstdDecompressor().decompress(body)
+        return gzip.decompress(body)
+
+    @staticmethod
+    def encode(data: Any) -> bytes:
+        """
+        Static method for encoding response data.
+        :param data: Response data.
+        :return: Compressed response body.
+        """
+        return RawResponseStore.compress(orjson.dumps(data))
+
+    @staticmethod
+    def decode(body: bytes) -> Any:
+        """
+        Static method for decoding response data.
+        :param body: Compressed response body.
+        :return: Response data.
+        """
+        return orjson.loads(RawResponseStore.decompress(body))
+
+    def put(self, url: str, data: Any, etag: str | None = None, last_modified: str | None = None) -> None:
+        """
+        Method for saving a response.
+        The body is only rewritten, if the response data changed.
+        :param url: Response URL.
+        :param data: Response data.
+        :param etag: ETag header of the response.
+            Defaults to None.
+        :param last_modified: Last-Modified header of the response.
+            Defaults to None.
+        """
+        content = orjson.dumps(data)
+        checksum = hashlib.blake2b(content, digest_size=16).hexdigest()
+        with self._lock:
+            if self.connection.execute("UPDATE raw SET etag = ?, last_modified = ?, fetched = CURRENT_TIMESTAMP WHERE url = ? AND checksum = ?", 
+                                       (etag, last_modified, url, checksum)).rowcount == 0:
+                self.connection.execute("INSERT OR REPLACE INTO raw (url, body, checksum, etag, last_modified) VALUES (?, ?, ?, ?, ?)", 
+                                        (url, self.compress(content), checksum, etag, last_modified))
+            self.connection.commit()
+
+    def get(self, url: str) -> Optional[Any]:
+        """
+        Method for loading a response.
+        :param url: Response URL.
+        :return: Response data, if found.
+        """
+        with self._lock:
+            row = self.connection.execute("SELECT body FROM raw WHERE url = ?", (url,)).fetchone()
+        return None if row is None else self.decode(row[0])
+
+    def get_validators(self, url: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Method for loading the HTTP validators of a response.
+        :param url: Response URL.
+        :return: ETag and Last-Modified header of the stored response, if found.
+        """
+        with self._lock:
+            row = self.connection.execute("SELECT etag, last_modified FROM raw WHERE url = ?", (url,)).fetchone()
+        return (None, None) if row is None else row
+
+    def iter_raw(self, batch_size: int = 100) -> Generator[Tuple[str, bytes], None, None]:
+        """
+        Method for iterating over compressed responses.
+        :param batch_size: Number of rows to fetch at once.
+            Defaults to 100.
+        :return: Generator, yielding URLs and compressed response bodies.
+        """
+        cursor = self.connection.execute("SELECT url, body FROM raw ORDER BY fetched")
+        while rows := cursor.fetchmany(batch_size):
+            yield from rows
+
+    def __iter__(self) -> Generator[Tuple[str, Any], None, None]:
+        """
+        Method for iterating over responses.
+        :return: Generator, yielding URLs and response data.
+        """
+        for url, body in self.iter_raw():
+            yield url, self.decode(body)
+
+    def __len__(self) -> int:
+        """
+        Method for counting responses.
+        :return: Number of responses.
+        """
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM raw").fetchone()[0]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+****************************************************
+*                CivitAI Scraping                  *
+*            (c) 2025 Alexander Hering             *
+****************************************************
+"""
+import os
+import sqlite3
+from threading import Lock
+
+
+class SQLiteFileStore(object):
+    """
+    Class, representing a store, backed by a single SQLite file, which is shared across threads.
+    """
+
+    def __init__(self, path: str, default_file_name: str) -> None:
+        """
+        Initiation method.
+        :param path: Path of the SQLite file, ending in '.db', or a folder in which case the default file name is used.
+            Missing folders are created.
+        :param default_file_name: Default file name.
+        """
+        if not path.endswith(".db"):
+            path = os.path.join(path, default_file_name)
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self._lock = Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+    def close(self) -> None:
+        """
+        Method for closing the store.
+        """
+        self.connection.close()
@@ -7,12 +7,29 @@
 """
 import os
 import requests
-import json
+import orjson
 from time import sleep
 import logging
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
 from urllib.parse import urlparse
-from typing import Any, Optional, List
-from src.utility import json_utility, requests_utility, time_utility
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib3.util.retry import Retry
+from typing import Any, Optional, List, Dict
+from src.utility import requests_utility, time_utility
+from src.database.raw_response_store import RawResponseStore
+
+
+@lru_cache(maxsize=4096)
+def get_netloc(url: str) -> str:
+    """
+    Function for extracting the lowercase network location of a URL.
+    :param url: Target URL.
+    :return: Network location.
+    """
+    return urlparse(url).netloc.lower()
 
 
 class CivitaiAPIWrapper(object):
@@ -24,29 +41,47 @@ class CivitaiAPIWrapper(object):
                  api_key: str = None, 
                  wait_time: float = 1.5, 
                  response_output_path: str | None = None, 
-                 logger_overwrite: Any = None) -> None:
+                 logger_overwrite: Any = None,
+                 fetch_cache_size: int = 4096) -> None:
         """
         Initiation method.
         :param api_key: Civitai API key which can be created in the civitai user account settings.
         :param wait_time: Waiting time in seconds between requests or download tries.
-        :param response_output_path: Folder path to backup raw responses.
+        :param response_output_path: Folder path to backup raw responses into a compressed response store.
             Defaults to None in which case raw response content is not backed up.
         :param logger_overwrite: Logger overwrite for logging progress.
             Defaults to None in which case the progress is not logged.
+        :param fetch_cache_size: Maximum number of fetched responses to keep for cached fetches.
+            Defaults to 4096.
         """
         self.logger = logging.Logger("[CivitaiAPIWrapper]") if logger_overwrite is None else logger_overwrite
         self.api_key = api_key
         self.headers = {"Authorization": "Bearer " + self.api_key}
+        self.session = requests_utility.get_session(
+            headers=self.headers,
+            pool_connections=32,
+            pool_maxsize=32,
+            # Only connection errors are retried by the adapter, response statuses are handled in safely_fetch_api_data
+            retries=Retry(total=3, backoff_factor=0.5)
+        )
+        self.image_session = requests_utility.get_session(pool_maxsize=8)
         self.base_url = "https://civitai.com/"
+        self.base_netloc = get_netloc(self.base_url)
         self.api_base_url = f"{self.base_url}api/v1"
         self.model_version_api_endpoint = f"{self.api_base_url}/model-versions"
         self.model_version_by_hash_endpoint = f"{self.model_version_api_endpoint}/by-hash"
         self.model_api_endpoint = f"{self.api_base_url}/models"
         self.image_api_endpoint = f"{self.api_base_url}/images"
         self.wait = wait_time
-        self.response_path = response_output_path
+        self.rate_limiter = time_utility.RateLimiter(wait_time)
+        self.response_path = None
+        self.response_store = None
         if response_output_path:
-            os.makedirs(response_output_path, exist_ok=True)
+            self.response_store = RawResponseStore(response_output_path)
+            self.response_path = os.path.dirname(self.response_store.path)
+        self.fetch_cache = OrderedDict()
+        self.fetch_cache_size = fetch_cache_size
+        self._fetch_cache_lock = Lock()
 
     def get_source_name(self) -> str:
         """
@@ -61,7 +96,7 @@ class CivitaiAPIWrapper(object):
         :param kwargs: Arbitrary keyword arguments.
         :return: True if connection was established successfully else False.
         """
-        result = requests.get(self.base_url).status_code == 200
+        result = self.session.get(self.base_url).status_code == 200
         self.logger.info("Connection was successfully established.") if result else self.logger.warning(
             "Connection could not be established.")
         return result
@@ -72,7 +107,7 @@ class CivitaiAPIWrapper(object):
         :param url: Target URL.
         :return: True, if wrapper is responsible for URL else False.
         """
-        return urlparse(url).netloc in self.base_url
+        return get_netloc(url) == self.base_netloc
 
     def scrape_available_asset_metadata(self, asset_type: str, **kwargs: Optional[dict]) -> List[dict]:
         """
@@ -107,8 +142,7 @@ class CivitaiAPIWrapper(object):
                 "models": f"{self.model_api_endpoint}?sort=Newest&nsfw=true&limit=100", 
                 "images": f"{self.image_api_endpoint}?sort=Newest&nsfw=true&limit=100"}[asset_type]
         while next_url:
-            sleep(self.wait)
-            data = self.safely_fetch_api_data(next_url, current_try=1)
+            data = self.safely_fetch_api_data(next_url)
             next_url = False
             if isinstance(data, dict):
                 metadata = data["metadata"]
@@ -123,48 +157,177 @@ class CivitaiAPIWrapper(object):
             else:
                 self.logger.warning(f"Fetched data is no dictionary: {data}")
 
-    def safely_fetch_api_data(self, url: str, current_try: int = 3, max_tries: int = 3) -> dict:
+    def safely_fetch_api_data(self, url: str, max_tries: int = 3, cache: bool = False, payload: Any = None) -> dict:
         """
         Method for fetching API data.
+        Requests are spaced by the shared rate limiter, so that concurrent callers respect the waiting time.
+        GET requests for responses in the response store are sent conditionally and unchanged responses are loaded from the store.
+        Failed tries are repeated with exponential backoff, rate limited tries after the time requested by the server.
         :param url: Target URL.
-        :param current_try: Current try.
-            Defaults to 3, which results in a single fetching try with max_tries at 3.
         :param max_tries: Maximum number of tries.
             Defaults to 3.
+        :param cache: Flag for answering repeated fetches of the same URL from the fetch cache.
+            Should only be used for idempotent lookups, not for paginated listings.
+            Defaults to False.
+        :param payload: JSON payload to POST instead of issuing a GET request.
+            Responses to POST requests are neither cached nor backed up.
+            Defaults to None.
         :return: Fetched data or empty dictionary.
         """
+        cache = cache and payload is None
+        if cache:
+            with self._fetch_cache_lock:
+                if url in self.fetch_cache:
+                    self.fetch_cache.move_to_end(url)
+                    return self.fetch_cache[url]
         self.logger.info(
             f"Fetching data for '{url}'...")
         
-        try:
-            resp = requests.get(url, headers=self.headers)
-            data = json.loads(resp.content)
-            if data is not None and not "error" in data:
-                self.logger.info(f"Fetching content was successful.")
-                if self.response_path:
-                    open(os.path.join(self.response_path, "#last_fetched_url.txt"), "w").write(url)
-                    json_utility.save(data, os.path.join(self.response_path, time_utility.get_timestamp() + ".json"))
-                return data
-            else:
-                self.logger.warning(f"Fetching metadata failed.")
-        except json.JSONDecodeError:
-            self.logger.warning(f"Response content could not be deserialized.")
-            if current_try < max_tries:
-                sleep(self.wait*2)
-                return self.safely_fetch_api_data(url, current_try+1, max_tries=max_tries)
-        except requests.exceptions.ConnectionError:
-            self.logger.warning(f"Connection was closed.")
-            if current_try < max_tries:
-                sleep(self.wait*2)
-                return self.safely_fetch_api_data(url, current_try+1, max_tries=max_tries)
+        for current_try in range(max_tries):
+            delay = self.wait * 2**current_try
+            try:
+                self.rate_limiter.wait()
+                if payload is None:
+                    resp = self.session.get(url, headers=self.get_conditional_headers(url))
+                else:
+                    resp = self.session.post(url, data=orjson.dumps(payload), headers={"Content-Type": "application/json"})
+                if resp.status_code == 304:
+                    if (data := self.get_stored_response(url)) is not None:
+                        self.logger.info(f"Content did not change, using stored response.")
+                        if cache:
+                            self._cache_fetched_data(url, data)
+                        return data
+                    self.logger.warning(f"Stored response is not available, fetching without validators.")
+                    self.rate_limiter.wait()
+                    resp = self.session.get(url)
+                if resp.status_code in (429, 503):
+                    self.logger.warning(f"Request was rate limited." if resp.status_code == 429 else f"Service is unavailable.")
+                    delay = self.get_retry_after(resp, default=delay)
+                else:
+                    resp.raise_for_status()
+                    data = orjson.loads(resp.content)
+                    if data is not None and not "error" in data:
+                        self.logger.info(f"Fetching content was successful.")
+                        if self.response_path and payload is None:
+                            open(os.path.join(self.response_path, "#last_fetched_url.txt"), "w").write(url)
+                            self.response_store.put(url, data, etag=resp.headers.get("ETag"), last_modified=resp.headers.get("Last-Modified"))
+                        if cache:
+                            self._cache_fetched_data(url, data)
+                        return data
+                    else:
+                        self.logger.warning(f"Fetching metadata failed.")
+                        return {}
+            except requests.exceptions.HTTPError as ex:
+                if ex.response.status_code < 500:
+                    self.logger.warning(f"Fetching metadata failed ({ex}).")
+                    return {}
+                self.logger.warning(f"Server responded with an error ({ex}).")
+            except ValueError:
+                self.logger.warning(f"Response content could not be deserialized.")
+            except requests.exceptions.ConnectionError:
+                self.logger.warning(f"Connection was closed.")
+            if current_try < max_tries - 1:
+                sleep(delay)
         return {}
 
-    def download_asset(self, asset_url: str, output_path: str) -> None:
+    def get_stored_response(self, url: str) -> Any:
+        """
+        Method for loading a stored response.
+        :param url: Target URL.
+        :return: Stored response data or None, if no response is stored or it can not be decompressed.
+        """
+        if self.response_store is None:
+            return None
+        try:
+            return self.response_store.get(url)
+        except ImportError as ex:
+            self.logger.warning(f"Stored response could not be loaded ({ex}).")
+            return None
+
+    def get_conditional_headers(self, url: str) -> dict:
+        """
+        Method for building the headers for a conditional GET request from the stored response validators.
+        :param url: Target URL.
+        :return: Conditional headers, empty if no validators are stored.
+        """
+        if self.response_store is None:
+            return {}
+        etag, last_modified = self.response_store.get_validators(url)
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    @staticmethod
+    def get_retry_after(response: requests.Response, default: float) -> float:
+        """
+        Static method for extracting the waiting time, requested by the server via the Retry-After header.
+        :param response: Response.
+        :param default: Default waiting time in seconds.
+        :return: Waiting time in seconds.
+        """
+        retry_after = response.headers.get("Retry-After")
+        if not retry_after:
+            return default
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+        try:
+            return max((parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+        except (TypeError, ValueError):
+            return default
+
+    def fetch_model_versions_by_hashes(self, hashes: List[str], batch_size: int = 100) -> Dict[str, dict]:
+        """
+        Method for looking up model versions for multiple SHA256 file hashes with batched requests.
+        :param hashes: SHA256 file hashes.
+        :param batch_size: Number of hashes per request.
+            Defaults to 100.
+        :return: Dictionary, mapping uppercase hashes to model version metadata.
+            Hashes without a matching model version map to an empty dictionary, hashes of failed requests are left out.
+        """
+        result = {}
+        hashes = list(dict.fromkeys(hash.upper() for hash in hashes))
+        for index in range(0, len(hashes), batch_size):
+            batch = hashes[index:index + batch_size]
+            data = self.safely_fetch_api_data(self.model_version_by_hash_endpoint, payload=batch)
+            if not isinstance(data, list):
+                continue
+            result.update({hash: {} for hash in batch})
+            for model_version in data:
+                for file in model_version.get("files", []):
+                    file_hash = file.get("hashes", {}).get("SHA256", "").upper()
+                    if file_hash in result:
+                        result[file_hash] = model_version
+        return result
+
+    def _cache_fetched_data(self, url: str, data: dict) -> None:
+        """
+        Method for adding fetched data to the fetch cache, evicting the least recently used entries.
+        :param url: Target URL.
+        :param data: Fetched data.
+        """
+        with self._fetch_cache_lock:
+            self.fetch_cache[url] = data
+            self.fetch_cache.move_to_end(url)
+            while len(self.fetch_cache) > self.fetch_cache_size:
+                self.fetch_cache.popitem(last=False)
+
+    def download_asset(self, asset_url: str, output_path: str) -> bool:
         """
         Abstract method for downloading an asset.
         :param asset_url: Asset URL.
         :param output_path: Output path.
+        :return: True, if download was successful, else False.
         """
         #TODO: Test and refine for different asset types.
-        requests_utility.download_web_asset(
-            asset_url, output_path=output_path, headers=self.headers)
\ No newline at end of file
+        try:
+            requests_utility.download_web_asset(
+                asset_url, output_path=output_path, headers=self.headers, session=self.image_session)
+            return True
+        except requests.exceptions.RequestException as ex:
+            self.logger.warning(f"Downloading '{asset_url}' failed ({ex}).")
+            return False
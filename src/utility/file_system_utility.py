@@ -6,7 +6,7 @@
 ****************************************************
 """
 import os
-from typing import List
+from typing import List, Generator, Collection
 
 
 def create_folder_tree(root: str, structure: list) -> None:
@@ -71,6 +71,30 @@ def get_all_files(path: str, include_root: bool = True) -> List[str]:
     return list(set(file_list))
 
 
+def iter_files(path: str, extensions: Collection[str] | None = None) -> Generator[str, None, None]:
+    """
+    Function for lazily iterating over all files (including nested files) under given directory.
+    Uses os.scandir, so that file types are taken from the directory entries without additional stat calls.
+    Like os.walk, symlinked files are returned, symlinked directories are not followed and unreadable directories are skipped.
+    :param path: Root path to start file search in.
+    :param extensions: Lowercase file extensions to filter for.
+        Defaults to None in which case all files are returned.
+    :return: Generator, yielding file paths.
+    """
+    folders = [path]
+    while folders:
+        try:
+            with os.scandir(folders.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        folders.append(entry.path)
+                    elif entry.is_file() and (
+                        extensions is None or os.path.splitext(entry.name)[1].lower() in extensions):
+                        yield entry.path
+        except OSError:
+            continue
+
+
 def get_all_folders(path: str, include_root: bool = True) -> List[str]:
     """
     Function for collecting all folders (including nested folders) under given directory.
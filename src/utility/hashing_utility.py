@@ -5,22 +5,38 @@
 *            (c) 2023 Alexander Hering             *
 ****************************************************
 """
+import os
+import mmap
 import hashlib
+from typing import Any
+
+
+def _new_sha256() -> Any:
+    """
+    Function for creating a SHA256 hash object, flagged as not used for security where supported.
+    :return: Hash object.
+    """
+    try:
+        return hashlib.new("sha256", usedforsecurity=False)
+    except TypeError:
+        return hashlib.sha256()
 
 
 def hash_with_sha256(file_path: str) -> str:
     """
     Function for hashing file with SHA256.
+    Uses hashlib.file_digest where available (Python 3.11+), else feeds a memory mapped file in a single update.
     :param file_path: File path.
     :return: Hash.
     """
-    h  = hashlib.sha256()
-    b  = bytearray(128*1024)
-    mv = memoryview(b)
-    with open(file_path, 'rb', buffering=0) as f:
-        for n in iter(lambda : f.readinto(mv), 0):
-            h.update(mv[:n])
-    return h.hexdigest()
+    with open(file_path, "rb") as f:
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, _new_sha256).hexdigest()
+        h = _new_sha256()
+        if os.fstat(f.fileno()).st_size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                h.update(mm)
+        return h.hexdigest()
 
 
 def hash_text_with_sha256(text: str) -> str:
@@ -13,6 +13,13 @@ LOGGER = logging.Logger("[ImageUtility]")
 
 
 IMAGE_EXTENSIONS = [".jpeg", ".jpg", ".png"]
+# Dictionary, mapping image formats to leading and trailing magic bytes
+IMAGE_SIGNATURES = {
+    "jpeg": (b"\xff\xd8\xff", b"\xff\xd9"),
+    "png": (b"\x89PNG\r\n\x1a\n", b"IEND\xaeB`\x82")
+}
+MIN_IMAGE_SIZE = 128
+SUSPICIOUS_IMAGE_SIZE = 1024
 
 
 def check_image_health(file_path: str) -> bool:
@@ -40,3 +47,27 @@ def check_image_health(file_path: str) -> bool:
     except: 
         LOGGER.warning(f"'{file_path}' is corrupted!")
         return False
+
+
+def check_image_health_fast(file_path: str) -> bool:
+    """
+    Function for quickly checking image file health by its leading and trailing magic bytes.
+    Files with unexpected magic bytes and suspiciously small files are fully decoded via check_image_health.
+    :param file_path: File path of image file to check.
+    :return: True, if image file is healthy, else False.
+    """
+    try:
+        file_size = os.stat(file_path).st_size
+        if file_size < MIN_IMAGE_SIZE:
+            return False
+        with open(file_path, "rb") as image_file:
+            header = image_file.read(8)
+            image_file.seek(-12, os.SEEK_END)
+            trailer = image_file.read()
+    except OSError:
+        return False
+    # JPEG files may carry padding after the end of image marker and files may hold other formats than their extension
+    if not any(header.startswith(leading) and trailer.rstrip(b"\x00").endswith(trailing) 
+               for leading, trailing in IMAGE_SIGNATURES.values()):
+        return check_image_health(file_path)
+    return file_size >= SUSPICIOUS_IMAGE_SIZE or check_image_health(file_path)
@@ -5,8 +5,13 @@
 *            (c) 2020-2022 Alexander Hering        *
 ****************************************************
 """
-import json
+import orjson
 import os
+from pathlib import Path
+
+
+# Serialization options, additionally allowing for non-string keys and numpy arrays
+SAVE_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
 
 
 def save(data: dict, path: str) -> None:
@@ -15,8 +20,7 @@ def save(data: dict, path: str) -> None:
     :param data: Data as dictionary.
     :param path: Save path.
     """
-    with open(path, "w", encoding="utf-8") as out_file:
-        json.dump(data, out_file, indent=4, ensure_ascii=False)
+    Path(path).write_bytes(orjson.dumps(data, option=SAVE_OPTIONS))
 
 
 def load(path: str) -> dict:
@@ -25,8 +29,7 @@ def load(path: str) -> dict:
     :param path: Save path.
     :return: Dictionary containing data.
     """
-    with open(path, "r", encoding="utf-8") as in_file:
-        return json.load(in_file)
+    return orjson.loads(Path(path).read_bytes())
 
 
 def is_json_file(path: str) -> bool:
@@ -48,9 +51,9 @@ def is_json(text: str) -> bool:
     :return: True if text contains json data, else False.
     """
     try:
-        json.loads(text)
+        orjson.loads(text)
         return True
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         return False
     except TypeError:
         return False
@@ -6,14 +6,20 @@
 ****************************************************
 """
 import os
+import shutil
 from time import sleep
 from typing import Union, List, Any, Optional
 from . import json_utility
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import math
 from lxml import html
 
 
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
 REQUEST_METHODS = {
     "GET": requests.get,
     "POST": requests.post,
@@ -41,15 +47,33 @@ def get_page_content(url: str) -> html.HtmlElement:
     return html.fromstring(page.content)
 
 
-def get_session(proxy_dict: dict = None) -> requests.Session:
+def get_session(proxy_dict: dict = None, 
+                headers: dict = None, 
+                pool_connections: int = 10, 
+                pool_maxsize: int = 10, 
+                retries: Union[Retry, int] = 0) -> requests.Session:
     """
     Function for getting requests session.
+    Connections are kept alive and reused for subsequent requests to the same host.
     :param proxy_dict: Proxy dictionary.
+    :param headers: Headers to send with every request.
+        Defaults to None.
+    :param pool_connections: Number of host connection pools to cache.
+        Defaults to 10.
+    :param pool_maxsize: Maximum number of connections to keep per host.
+        Defaults to 10.
+    :param retries: Retry configuration or maximum number of retries for failed connections.
+        Defaults to 0.
     :return: Session.
     """
     session = requests.session()
     if proxy_dict != None:
         session.proxies = proxy_dict
+    if headers:
+        session.headers.update(headers)
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
 
     return session
 
@@ -108,53 +132,53 @@ def safely_request_page(url, tries: int = 5, delay: float = 2.0) -> requests.Res
     return resp
 
 
-def download_web_asset(asset_url: str, output_path: str, add_extension: bool = False, headers: dict = None) -> None:
+def download_web_asset(asset_url: str, output_path: str, add_extension: bool = False, headers: dict = None, session: requests.Session = None) -> None:
     """
     Function for downloading web asset.
+    The response is streamed to disk in chunks of 1 MiB.
     :param asset_url: Asset URL.
     :param output_path: Output path.
     :param add_extension: Flag, declaring whether to fetch extension from header data and add to output path.
         Defaults to False.
     :param headers: Headers to use.
         Default to None.
+    :param session: Session to reuse connections from.
+        Defaults to None in which case a new connection is opened.
     """
+    requester = requests if session is None else session
+    headers = {**(headers or {}), "Accept-Encoding": "identity"}
     try:
-        asset_head = requests.head(asset_url, headers=headers).headers
-        asset = requests.get(
+        asset = requester.get(
             asset_url, headers=headers, stream=True)
     except requests.exceptions.SSLError:
-        asset_head = requests.head(
-            asset_url, headers=headers, verify=False).headers
-        asset = requests.get(
+        asset = requester.get(
             asset_url, headers=headers, stream=True, verify=False)
 
-    if add_extension:
-        main_type, sub_type = asset_head.get(
-            "Content-Type", "/").lower().split("/")
-        # asset_type = asset_head.get("Content-Type")
-        # asset_encoding = asset.apparent_encoding if hasattr(
-        #    asset, "apparent_encoding") else asset.encoding
-        asset_extension = MEDIA_TYPES.get(
-            main_type, {}).get(sub_type, {}).get("extension", ".unkown")
-        output_path += asset_extension
-
-    asset_size = int(asset.headers.get("content-length", 0))
-    chunk_size = 1024
-    local_size = 0
-
-    try:
-        from tqdm import tqdm
-        with tqdm.wrapattr(open(output_path, "wb"), "write",
-                           miniters=1, desc=f"Downloading '{asset_url}' ...",
-                           total=asset_size) as output_file:
-            for chunk in asset.iter_content(chunk_size=chunk_size):
-                output_file.write(chunk)
-                local_size += len(chunk)
-    except ImportError:
-        with open(output_path, "wb") as output_file:
-            for chunk in asset.iter_content(chunk_size=chunk_size):
-                output_file.write(chunk)
-                local_size += len(chunk)
-    if local_size != asset_size:
+    with asset:
+        asset.raise_for_status()
+        if add_extension:
+            main_type, sub_type = asset.headers.get(
+                "Content-Type", "/").lower().split(";")[0].split("/")
+            # asset_type = asset_head.get("Content-Type")
+            # asset_encoding = asset.apparent_encoding if hasattr(
+            #    asset, "apparent_encoding") else asset.encoding
+            asset_extension = MEDIA_TYPES.get(
+                main_type, {}).get(sub_type, {}).get("extension", ".unkown")
+            output_path += asset_extension
+
+        asset_size = int(asset.headers.get("content-length", 0))
+        asset.raw.decode_content = True
+
+        try:
+            from tqdm import tqdm
+            with tqdm.wrapattr(open(output_path, "wb"), "write",
+                               miniters=1, desc=f"Downloading '{asset_url}' ...",
+                               total=asset_size) as output_file:
+                shutil.copyfileobj(asset.raw, output_file, length=DOWNLOAD_CHUNK_SIZE)
+        except ImportError:
+            with open(output_path, "wb") as output_file:
+                shutil.copyfileobj(asset.raw, output_file, length=DOWNLOAD_CHUNK_SIZE)
+    local_size = os.path.getsize(output_path)
+    if asset_size and local_size != asset_size:
         raise requests.exceptions.RequestException(
             f"Downloading '{asset_url}' failed ({local_size}/{asset_size})!")
@@ -6,19 +6,22 @@
 ****************************************************
 """
 import copy
+import orjson
 from enum import Enum
 from datetime import datetime as dt
 from sqlalchemy import Column, String, Boolean, Integer, JSON, Text, DateTime, VARCHAR, CHAR, ForeignKey, Table, Float, BLOB, Uuid
-from sqlalchemy import func, select
+from sqlalchemy import func, select, insert, event
 from sqlalchemy.inspection import inspect as inspect
 from sqlalchemy.orm import relationship
 from sqlalchemy import and_, or_, not_, select
 from sqlalchemy import create_engine
 from sqlalchemy.ext.automap import automap_base, classname_for_table
 from sqlalchemy import orm
-from sqlalchemy.engine import create_engine, Engine
+from sqlalchemy.engine import create_engine, Engine, make_url
+from sqlalchemy.pool import StaticPool
 from sqlalchemy.sql import text
 from sqlalchemy.ext.automap import automap_base
+from sqlalchemy.dialects import sqlite, postgresql
 from datetime import datetime as dt
 from uuid import UUID
 from typing import List, Any, Optional
@@ -45,6 +48,12 @@ SQLALCHEMY_FILTER_CONVERTER = {
     "!": lambda x: not_(x)
 }
 
+# Dictionary, mapping dialects to insert constructs, which support "ON CONFLICT" clauses
+UPSERT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert
+}
+
 # Supported dialects
 SUPPORTED_DIALECTS = ["sqlite", "mysql",
                       "mssql", "postgresql", "mariadb", "oracle", "duckdb"]
@@ -94,20 +103,78 @@ SQLALCHEMY_TYPING_FROM_COLUMN_DICTIONARY = {
 }
 
 
-def get_engine(engine_url: str, pool_recycle: int = 280, encoding: str = "utf-8") -> Engine:
+def serialize_json(data: Any) -> str:
+    """
+    Function for serializing JSON column values with orjson.
+    :param data: Column value.
+    :return: JSON string.
+    """
+    return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+
+def is_in_memory_sqlite(engine_url: Any) -> bool:
+    """
+    Function for checking whether an engine URL points to an in-memory SQLite database.
+    :param engine_url: Engine URL as string or URL object.
+    :return: True, if the URL points to an in-memory SQLite database, else False.
+    """
+    url = make_url(engine_url)
+    return url.get_backend_name() == "sqlite" and (
+        url.database in (None, "", ":memory:") or url.query.get("mode") == "memory")
+
+
+def get_pool_kwargs(engine_url: str, pool_size: int = 16, max_overflow: int = 32) -> dict:
+    """
+    Function for getting connection pool parameters for an engine URL.
+    In-memory SQLite databases share a single connection across threads, 
+    other databases get a connection pool, sized for concurrent workers, which checks connections before use.
+    :param engine_url: URL to create engine for.
+    :param pool_size: Number of connections to keep open.
+        Defaults to 16.
+    :param max_overflow: Number of additional connections to open under load.
+        Defaults to 32.
+    :return: Pool parameters.
+    """
+    if is_in_memory_sqlite(engine_url):
+        return {"poolclass": StaticPool, "connect_args": {"check_same_thread": False}}
+    return {"pool_size": pool_size, "max_overflow": max_overflow, "pool_pre_ping": True}
+
+
+JSON_SERIALIZER_BACKENDS = {"sqlite", "postgresql", "mysql", "mariadb", "mssql"}
+
+
+def get_engine(engine_url: str, pool_recycle: int = 280, encoding: str = "utf-8", **kwargs: Optional[Any]) -> Engine:
     """
     Function for getting database engine.
+    JSON columns are serialized and deserialized with orjson on backends, whose dialects support custom JSON serializers.
     :param engine_url: URL to create engine for.
     :param pool_recycle: Parameter for preventing the reuse of connections that were stale for some time.
     :param encoding: Encoding string. Defaults to 'utf-8'.
+    :param kwargs: Additional engine parameters, e.g. for connection pooling.
     :return: Engine to given database.
     """
+    if make_url(engine_url).get_backend_name() in JSON_SERIALIZER_BACKENDS:
+        kwargs = {"json_serializer": serialize_json, "json_deserializer": orjson.loads, **kwargs}
     try:
         # SQLAlchemy 1.4
-        return create_engine(engine_url, encoding=encoding, pool_recycle=pool_recycle)
+        return create_engine(engine_url, encoding=encoding, pool_recycle=pool_recycle, **kwargs)
     except TypeError:
         # SQLAlchemy 2.0
-        return create_engine(engine_url, pool_recycle=pool_recycle)
+        return create_engine(engine_url, pool_recycle=pool_recycle, **kwargs)
+
+
+def register_sqlite_pragmas(engine: Engine, pragmas: dict) -> None:
+    """
+    Function for registering PRAGMA statements, which are executed on every new SQLite connection.
+    :param engine: SQLite database engine.
+    :param pragmas: Dictionary, mapping PRAGMA names to values.
+    """
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(f"PRAGMA {pragma}={pragmas[pragma]}")
+        cursor.close()
 
 
 def execute_command(engine: Engine, command: str) -> Optional[Any]:
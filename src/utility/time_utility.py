@@ -7,6 +7,8 @@
 """
 import datetime
 import re
+import time
+from threading import Lock
 from datetime import datetime as dt
 from typing import Any, Optional
 
@@ -153,4 +155,31 @@ def get_future_time(delta_time: datetime.timedelta, fmt: str = DEFAULTS_TS_FORMA
     :param fmt: Format for timestamp, defaults to default format.
     :return: Future timestamp.
     """
-    return (dt.now() + delta_time).strftime(fmt)
\ No newline at end of file
+    return (dt.now() + delta_time).strftime(fmt)
+
+
+class RateLimiter(object):
+    """
+    Class, representing a thread-safe rate limiter, which spaces out calls by a minimum interval.
+    """
+
+    def __init__(self, interval: float) -> None:
+        """
+        Initiation method.
+        :param interval: Minimum interval between two calls in seconds.
+        """
+        self.interval = interval
+        self._next_allowed = 0.0
+        self._lock = Lock()
+
+    def wait(self) -> None:
+        """
+        Method for blocking until the next call is allowed.
+        Only sleeps, if the previous call was less than the interval ago.
+        """
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_allowed - now
+            self._next_allowed = max(now, self._next_allowed) + self.interval
+        if delay > 0:
+            time.sleep(delay)